@@ -1,7 +1,7 @@
 """This is the mFi mPower module."""
 from __future__ import annotations
 
-from .device import MPowerDevice
+from .device import MPowerDevice, update_all
 from .entities import MPowerSensor, MPowerSwitch
 from .exceptions import *
 
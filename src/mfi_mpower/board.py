@@ -26,6 +26,17 @@ class MPowerBoard:
         "known_hosts": None,
     }
 
+    _str_keys: tuple[str, ...] = (
+        "name",
+        "sysid",
+        "cpurevision",
+        "revision",
+        "hwaddr",
+        "eu_model",
+        "model",
+        "ports",
+    )
+
     def __init__(
         self,
         device: device.MPowerDevice,  # pylint: disable=redefined-outer-name
@@ -36,21 +47,9 @@ class MPowerBoard:
 
     def __str__(self):
         """Represent this board as string."""
-        if self._data:
-            keys = [
-                "name",
-                "sysid",
-                "cpurevision",
-                "revision",
-                "hwaddr",
-                "eu_model",
-                "model",
-                "ports",
-            ]
-        else:
-            keys = ["host"]
-        vals = ", ".join([f"{k}={getattr(self, k)}" for k in keys])
-        return f"{__class__.__name__}({vals})"
+        keys = self._str_keys if self._data else ("host",)
+        vals = ", ".join(f"{k}={getattr(self, k)}" for k in keys)
+        return f"{type(self).__name__}({vals})"
 
     @property
     def host(self) -> str:
@@ -1,10 +1,14 @@
 """Ubiquiti mFi MPower device"""
 from __future__ import annotations
 
-import json
-from random import randrange
+import asyncio
+from collections.abc import Iterable
+import functools
+import random
+import secrets
 import ssl
 import time
+import weakref
 
 import aiohttp
 from yarl import URL
@@ -19,10 +23,117 @@ from .exceptions import (
     MPowerAPIDataError,
 )
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+
+@functools.lru_cache(maxsize=2)
+def _get_ssl_context(verify_ssl: bool) -> ssl.SSLContext:
+    """Return a shared SSL context for mFi mPower devices."""
+    # NOTE: Ubiquiti mFi mPower Devices with firmware 2.1.11 use OpenSSL 1.0.0g (18 Jan 2012)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLSv1)
+    context.set_ciphers("AES128-SHA")
+    if verify_ssl:
+        context.load_default_certs()
+        context.verify_mode = ssl.CERT_REQUIRED
+    else:
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def _resolve_url(base: URL, url: URL) -> URL:
+    """Return the absolute URL for a device URL."""
+    if url.is_absolute():
+        return url
+    return base / str(url).lstrip("/")
+
+
+@functools.lru_cache(maxsize=16)
+def _resolve_url_str(base: URL, url: str) -> URL:
+    """Return the absolute URL for a device URL string."""
+    return _resolve_url(base, URL(url))
+
+
+# NOTE: The event loop only keeps weak references to tasks
+_closing: set[asyncio.Task] = set()
+
+
+def _close_session(session: aiohttp.ClientSession) -> None:
+    """Close an owned session of a garbage collected device."""
+    if session.closed:
+        return
+    try:
+        task = asyncio.get_running_loop().create_task(session.close())
+    except RuntimeError:
+        return
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
 
 class MPowerDevice:
     """mFi mPower device representation."""
 
+    __slots__ = (
+        "host",
+        "url",
+        "_login_url",
+        "_logout_url",
+        "_status_url",
+        "_sensors_url",
+        "username",
+        "password",
+        "cache_time",
+        "_board_info",
+        "_timeout",
+        "_board",
+        "_session_owned",
+        "_session",
+        "_finalizer",
+        "_ssl",
+        "_cookie",
+        "_headers",
+        "_request_options",
+        "_authenticated",
+        "_login_lock",
+        "_latency",
+        "_time",
+        "_deadline",
+        "_data",
+        "_texts",
+        "_host_data",
+        "_lan_data",
+        "_wlan_data",
+        "_port_data",
+        "_lan_connected",
+        "_stale",
+        "_model",
+        "_description",
+        "_generation",
+        "_update_task",
+        "_update_generation",
+        "_poll_task",
+        "_poll_error",
+        "__weakref__",
+    )
+
+    _str_keys: tuple[str, ...] = ("name", "ipaddr", "hwaddr", "model")
+
+    _models: dict[int, str] = {
+        1: "mPower mini",
+        3: "mPower",
+        6: "mPower Pro",
+        8: "mPower Pro",
+    }
+
+    _descriptions: dict[int, str] = {
+        1: "mFi Power Adapter with Wi-Fi",
+        3: "3-Port mFi Power Strip with Wi-Fi",
+        6: "6-Port mFi Power Strip with Ethernet and Wi-Fi",
+        8: "8-Port mFi Power Strip with Ethernet and Wi-Fi",
+    }
+
     def __init__(
         self,
         host: str,
@@ -33,17 +144,25 @@ class MPowerDevice:
         cache_time: float = 0.0,
         board_info: bool | None = None,
         session: aiohttp.ClientSession | None = None,
+        timeout: float | None = 10.0,
+        ssl_context: ssl.SSLContext | None = None,
     ) -> None:
         """Initialize the device."""
         self.host = host
         self.url = URL(f"https://{host}" if use_ssl else f"http://{host}")
+        self._login_url = self.url / "login.cgi"
+        self._logout_url = self.url / "logout.cgi"
+        self._status_url = self.url / "status.cgi"
+        self._sensors_url = self.url / "mfi" / "sensors.cgi"
         self.username = username
         self.password = password
         self.cache_time = cache_time
         self._board_info = board_info
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
 
         self._board = MPowerBoard(self)
 
+        self._finalizer: weakref.finalize | None = None
         if session is None:
             self._session_owned = True
             self._session = None
@@ -51,22 +170,53 @@ class MPowerDevice:
             self._session_owned = False
             self._session = session
 
-        # NOTE: Ubiquiti mFi mPower Devices with firmware 2.1.11 use OpenSSL 1.0.0g (18 Jan 2012)
         if use_ssl:
-            self._ssl = ssl.SSLContext(ssl.PROTOCOL_TLSv1)
-            self._ssl.set_ciphers("AES128-SHA")
-            self._ssl.load_default_certs()
-            self._ssl.verify_mode = ssl.CERT_REQUIRED if verify_ssl else ssl.CERT_NONE
+            self._ssl = ssl_context or _get_ssl_context(verify_ssl)
         else:
             self._ssl = False
 
-        self._cookie = (
-            f"AIROS_SESSIONID={''.join([str(randrange(9)) for i in range(32)])}"
-        )
+        # NOTE: The device authenticates this client-chosen session cookie on login
+        self._cookie = f"AIROS_SESSIONID={secrets.randbelow(10**32):032d}"
+        self._headers = {"Cookie": self._cookie}
+
+        # NOTE: Owned sessions carry SSL and cookie settings themselves
+        if self._session_owned:
+            self._request_options = {}
+        else:
+            self._request_options = {"headers": self._headers, "ssl": self._ssl}
 
         self._authenticated = False
-        self._time = time.time()
-        self._data = {}
+        self._login_lock: asyncio.Lock | None = None
+        self._latency = 0.0
+        self._time = 0.0
+        self._deadline = 0.0
+        self._stale = False
+        self._texts: tuple[str, str] | None = None
+        self.data = {}
+        self._generation = 0
+        self._update_task: asyncio.Task | None = None
+        self._update_generation = 0
+        self._poll_task: asyncio.Task | None = None
+        self._poll_error: Exception | None = None
+
+    @classmethod
+    async def create(
+        cls,
+        host: str,
+        username: str,
+        password: str,
+        use_ssl: bool = False,
+        verify_ssl: bool = False,
+        **kwargs,
+    ) -> MPowerDevice:
+        """Create a device without blocking the event loop for SSL setup."""
+        if use_ssl and kwargs.get("ssl_context") is None:
+            kwargs["ssl_context"] = await asyncio.to_thread(
+                _get_ssl_context, verify_ssl
+            )
+        return cls(
+            host, username, password, use_ssl=use_ssl, verify_ssl=verify_ssl, **kwargs
+        )
 
     async def __aenter__(self) -> MPowerDevice:
         """Enter context manager scope."""
@@ -80,12 +230,9 @@ class MPowerDevice:
 
     def __str__(self):
         """Represent this device as string."""
-        if self._data:
-            keys = ["name", "ipaddr", "hwaddr", "model"]
-        else:
-            keys = ["host"]
-        vals = ", ".join([f"{k}={getattr(self, k)}" for k in keys])
-        return f"{__class__.__name__}({vals})"
+        keys = self._str_keys if self._data else ("host",)
+        vals = ", ".join(f"{k}={getattr(self, k)}" for k in keys)
+        return f"{type(self).__name__}({vals})"
 
     @property
     def name(self) -> str:
@@ -118,17 +265,19 @@ class MPowerDevice:
         self, method: str, url: str | URL, data: dict | None = None
     ) -> str:
         """Session wrapper for general requests."""
-        url = URL(url)
-        if not url.is_absolute():
-            url = self.url / str(url).lstrip("/")
+        if isinstance(url, URL):
+            resolved = _resolve_url(self.url, url)
+        else:
+            resolved = _resolve_url_str(self.url, url)
+        start = time.monotonic()
         try:
             async with self._session.request(
                 method=method,
-                url=url,
-                headers={"Cookie": self._cookie},
+                url=resolved,
                 data=data,
-                ssl=self._ssl,
                 chunked=None,
+                timeout=self._timeout,
+                **self._request_options,
             ) as resp:
                 if resp.status != 200:
                     raise MPowerAPIReadError(
@@ -136,12 +285,9 @@ class MPowerDevice:
                     )
 
                 # NOTE: Un-authorized request will redirect to /login.cgi
-                if str(resp.url.path) == "/login.cgi":
-                    self._authenticated = False
-                else:
-                    self._authenticated = True
+                self._authenticated = resp.url.raw_path != "/login.cgi"
 
-                return await resp.text()
+                text = await resp.text()
         except aiohttp.ClientSSLError as exc:
             raise MPowerAPIConnError(
                 f"Could not verify SSL certificate of device {self.name}: {exc}"
@@ -150,33 +296,142 @@ class MPowerDevice:
             raise MPowerAPIConnError(
                 f"Connection to device {self.name} failed: {exc}"
             ) from exc
+        except asyncio.TimeoutError as exc:
+            raise MPowerAPIConnError(
+                f"Connection to device {self.name} timed out"
+            ) from exc
+
+        # NOTE: Track an exponential moving average of the request latency
+        latency = time.monotonic() - start
+        if self._latency:
+            latency = 0.1 * latency + 0.9 * self._latency
+        self._latency = latency
+
+        return text
 
     async def login(self) -> None:
         """Login to this device."""
         if self._session_owned and self._session is None:
-            self._session = aiohttp.ClientSession()
-        if not self._authenticated:
-            await self.request(
-                "POST",
-                "/login.cgi",
-                data={"username": self.username, "password": self.password},
+            # NOTE: Keep connections alive between polls to avoid repeated TLS handshakes
+            connector = aiohttp.TCPConnector(
+                ssl=self._ssl, limit=8, limit_per_host=4, keepalive_timeout=75
             )
-
-            if not self._authenticated:
-                raise MPowerAPIAuthError(
-                    f"Login to device {self.name} failed due to wrong API credentials"
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers=self._headers
+            )
+            self._finalizer = weakref.finalize(self, _close_session, self._session)
+        if not self._authenticated:
+            # NOTE: Concurrent callers must not trigger multiple logins
+            if self._login_lock is None:
+                self._login_lock = asyncio.Lock()
+            async with self._login_lock:
+                if self._authenticated:
+                    return
+
+                await self.request(
+                    "POST",
+                    self._login_url,
+                    data={"username": self.username, "password": self.password},
                 )
 
+                if not self._authenticated:
+                    raise MPowerAPIAuthError(
+                        f"Login to device {self.name} failed due to wrong API credentials"
+                    )
+
     async def logout(self) -> None:
         """Logout from this device."""
-        if self._authenticated:
-            await self.request("POST", "/logout.cgi")
-        if self._session_owned:
+        self.stop_polling()
+        try:
+            if self._authenticated:
+                await self.request("POST", self._logout_url)
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """Stop polling and close the session of this device if owned."""
+        self.stop_polling()
+        if self._finalizer is not None:
+            self._finalizer.detach()
+            self._finalizer = None
+        if self._session_owned and self._session is not None:
             await self._session.close()
             self._session = None
 
     async def update(self) -> None:
         """Update sensor data."""
+        # NOTE: Concurrent calls are coalesced into a single in-flight update,
+        #       unless it was started before the last call to expire()
+        while True:
+            if self._update_task is None:
+                board_done = self._board.updated or self._board_info is False
+                if board_done and not self._expired:
+                    return
+                self._update_generation = self._generation
+                self._update_task = asyncio.ensure_future(
+                    self._update(self._generation)
+                )
+                self._update_task.add_done_callback(self._update_done)
+            generation = self._update_generation
+            await asyncio.shield(self._update_task)
+            if generation == self._generation:
+                return
+
+    def expire(self) -> None:
+        """Mark cached sensor data as outdated for the next update."""
+        self._generation += 1
+        self._deadline = 0.0
+
+    def start_polling(self, interval: float) -> None:
+        """Start updating sensor data periodically in the background."""
+        # NOTE: Updates are skipped as long as cached data is younger than cache_time
+        self.stop_polling()
+        self._poll_task = asyncio.ensure_future(self._poll(interval))
+
+    def stop_polling(self) -> None:
+        """Stop updating sensor data in the background."""
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+
+    @property
+    def polling(self) -> bool:
+        """Return if sensor data is updated in the background."""
+        return self._poll_task is not None
+
+    @property
+    def poll_error(self) -> Exception | None:
+        """Return the error of the last failed background update, if any."""
+        return self._poll_error
+
+    async def _poll(self, interval: float) -> None:
+        """Update sensor data periodically."""
+        while True:
+            # NOTE: Any error must not end polling, but is kept for inspection
+            try:
+                await self.update()
+                self._poll_error = None
+            except Exception as exc:  # pylint: disable=broad-except
+                self._poll_error = exc
+                if self._data:
+                    self._stale = True
+            # NOTE: Jitter avoids synchronized requests when polling many devices
+            await asyncio.sleep(interval * random.uniform(0.9, 1.1))
+
+    @property
+    def _expired(self) -> bool:
+        """Return if the cached sensor data must be refreshed."""
+        return not self._data or time.monotonic() >= self._deadline
+
+    def _update_done(self, task: asyncio.Task) -> None:
+        """Release the in-flight update once it is done."""
+        self._update_task = None
+        # NOTE: Mark the exception as retrieved in case all waiters were cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def _update(self, generation: int) -> None:
+        """Update sensor data from the device."""
         # NOTE: If board_info is
         #        - True, one attempt will be made (raise)
         #        - None, one attempt will be made (no raise)
@@ -190,33 +445,63 @@ class MPowerDevice:
                 if self._board_info:
                     raise exc
 
-        if not self._data or (time.time() - self._time) > self.cache_time:
-            await self.login()
-            text_status = await self.request("GET", "/status.cgi")
-            text_sensors = await self.request("GET", "/mfi/sensors.cgi")
-
+        if self._expired:
+            # NOTE: Keep serving recent data during short connection drops
             try:
-                data = json.loads(text_status)
-                data.update(json.loads(text_sensors))
-            except aiohttp.ContentTypeError as exc:
-                raise MPowerAPIDataError(
-                    f"Received invalid data from device {self.name}: {exc}"
-                ) from exc
-
-            status = data.get("status", None)
-            if status != "success":
-                raise MPowerAPIDataError(
-                    f"Received invalid sensor update status from device {self.name}: {status}"
+                await self.login()
+                text_status, text_sensors = await asyncio.gather(
+                    self.request("GET", self._status_url),
+                    self.request("GET", self._sensors_url),
                 )
+            except (MPowerAPIConnError, MPowerAPIReadError):
+                if self._data and (time.monotonic() - self._time) < 4 * self.cache_time:
+                    self._stale = True
+                    return
+                raise
+
+            # NOTE: Unchanged responses keep the current data without decoding
+            texts = (text_status, text_sensors)
+            if texts == self._texts:
+                data = None
+            else:
+                try:
+                    data = json_loads(text_status)
+                    data.update(json_loads(text_sensors))
+                except ValueError as exc:
+                    raise MPowerAPIDataError(
+                        f"Received invalid data from device {self.name}: {exc}"
+                    ) from exc
+
+                status = data.get("status", None)
+                if status != "success":
+                    raise MPowerAPIDataError(
+                        f"Received invalid sensor update status from device {self.name}: {status}"
+                    )
 
-            self._time = time.time()
-            self._data = data
+            self._time = time.monotonic()
+            # NOTE: Data requested before the last call to expire() stays outdated
+            if generation == self._generation:
+                # NOTE: Slow devices are not queried more often than twice their latency,
+                #       unless caching is disabled with cache_time=0
+                cache_time = self.cache_time
+                if cache_time > 0:
+                    cache_time = max(cache_time, 2 * self._latency)
+                self._deadline = self._time + cache_time
+            self._stale = False
+            if data is not None:
+                self.data = data
+                self._texts = texts
 
     @property
     def updated(self) -> bool:
         """Return if the device data has already been updated."""
         return bool(self._data)
 
+    @property
+    def stale(self) -> bool:
+        """Return if the device data is outdated due to a failed update."""
+        return self._stale
+
     @property
     def data(self) -> dict:
         """Return device data."""
@@ -229,54 +514,61 @@ class MPowerDevice:
     @data.setter
     def data(self, data: dict) -> None:
         """Set device data."""
+        # NOTE: Data set from outside must not be mistaken for the last response
+        self._texts = None
         self._data = data
+        self._host_data = data.get("host", {})
+        self._lan_data = data.get("lan", {})
+        self._wlan_data = data.get("wlan", {})
+        self._port_data = data.get("sensors", [])
+        self._lan_connected = self._lan_data.get("status", "") != "Unplugged"
+        self._model = None
+        self._description = None
 
     @property
     def host_data(self) -> dict:
         """Return the device host data."""
-        return self.data.get("host", {})
+        return self._host_data
 
     @property
     def fwversion(self) -> str:
         """Return the device host firmware version."""
-        return self.host_data.get("fwversion", "")
+        return self._host_data.get("fwversion", "")
 
     @property
     def hostname(self) -> str:
         """Return the device host name."""
-        return self.host_data.get("hostname", "")
+        return self._host_data.get("hostname", "")
 
     @property
     def lan_data(self) -> dict:
         """Return the device LAN data."""
-        return self.data.get("lan", {})
+        return self._lan_data
 
     @property
     def wlan_data(self) -> dict:
         """Return the device WLAN data."""
-        return self.data.get("wlan", {})
+        return self._wlan_data
 
     @property
     def ipaddr(self) -> str:
         """Return the device IP address from LAN if connected, else from WLAN."""
-        lan_connected = self.lan_data.get("status", "") != "Unplugged"
-        if lan_connected:
-            return self.lan_data.get("ip", "")
-        return self.wlan_data.get("ip", "")
+        if self._lan_connected:
+            return self._lan_data.get("ip", "")
+        return self._wlan_data.get("ip", "")
 
     @property
     def hwaddr(self) -> str:
         """Return the device hardware address from LAN if connected, else from WLAN."""
-        lan_connected = self.lan_data.get("status", "") != "Unplugged"
-        if lan_connected:
-            return self.lan_data.get("hwaddr", "")
-        return self.wlan_data.get("hwaddr", "")
+        if self._lan_connected:
+            return self._lan_data.get("hwaddr", "")
+        return self._wlan_data.get("hwaddr", "")
 
     @property
     def unique_id(self) -> str:
         """Return a unique device id from combined LAN/WLAN hardware addresses."""
-        lan_hwaddr = self.lan_data.get("hwaddr", "")
-        wlan_hwaddr = self.wlan_data.get("hwaddr", "")
+        lan_hwaddr = self._lan_data.get("hwaddr", "")
+        wlan_hwaddr = self._wlan_data.get("hwaddr", "")
         if lan_hwaddr and wlan_hwaddr:
             return f"{lan_hwaddr}-{wlan_hwaddr}"
         return ""
@@ -284,42 +576,52 @@ class MPowerDevice:
     @property
     def port_data(self) -> list[dict]:
         """Return the device port data."""
-        return self.data.get("sensors", [])
+        return self._port_data
 
     @property
     def ports(self) -> int:
         """Return the number of available device ports."""
-        return len(self.port_data)
+        return len(self._port_data)
 
     @property
     def model(self) -> str:
         """Return the model name of this device as string."""
         if self._board.updated:
             return self._board.model
-        ports = self.ports
-        prefix = "mPower"
-        suffix = " (EU)" if self.eu_model else ""
-        if ports == 1:
-            return f"{prefix} mini" + suffix
-        if ports == 3:
-            return prefix + suffix
-        if ports in [6, 8]:
-            return f"{prefix} Pro" + suffix
-        return "Unknown"
+        if self._model is None:
+            model = self._models.get(self.ports)
+            if model is None:
+                self._model = "Unknown"
+            else:
+                self._model = model + (" (EU)" if self.eu_model else "")
+        return self._model
 
     @property
     def description(self) -> str:
         """Return the device description as string."""
-        ports = self.ports
-        if ports == 1:
-            return "mFi Power Adapter with Wi-Fi"
-        if ports == 3:
-            return "3-Port mFi Power Strip with Wi-Fi"
-        if ports == 6:
-            return "6-Port mFi Power Strip with Ethernet and Wi-Fi"
-        if ports == 8:
-            return "8-Port mFi Power Strip with Ethernet and Wi-Fi"
-        return ""
+        if self._description is None:
+            self._description = self._descriptions.get(self.ports, "")
+        return self._description
+
+    async def set_outputs(self, outputs: dict[int, bool], refresh: bool = True) -> None:
+        """Set multiple port outputs to on/off with a single refresh."""
+        try:
+            await asyncio.gather(
+                *(
+                    self.request(
+                        "POST",
+                        self._sensors_url,
+                        data={"id": port, "output": int(output)},
+                    )
+                    for port, output in outputs.items()
+                )
+            )
+        finally:
+            # NOTE: Cached data is outdated after switching outputs, even if only some
+            #       of the requests succeeded
+            self.expire()
+        if refresh:
+            await self.update()
 
     async def create_sensor(self, port: int) -> MPowerSensor:
         """Create a single sensor."""
@@ -344,3 +646,18 @@ class MPowerDevice:
         if not self.updated:
             await self.update()
         return [MPowerSwitch(self, i + 1) for i in range(self.ports)]
+
+    async def create_all(self) -> tuple[list[MPowerSensor], list[MPowerSwitch]]:
+        """Create all sensors and switches as lists."""
+        if not self.updated:
+            await self.update()
+        sensors = [MPowerSensor(self, i + 1) for i in range(self.ports)]
+        switches = [MPowerSwitch(self, i + 1) for i in range(self.ports)]
+        return sensors, switches
+
+
+async def update_all(devices: Iterable[MPowerDevice]) -> list[Exception | None]:
+    """Update multiple devices concurrently and return their errors."""
+    return await asyncio.gather(
+        *(device.update() for device in devices), return_exceptions=True
+    )
@@ -8,6 +8,10 @@ from .exceptions import MPowerAPIDataError
 class MPowerEntity:
     """mFi mPower entity representation."""
 
+    __slots__ = ("_device", "_port", "_index", "_data", "_output", "_relay", "_lock")
+
+    _str_keys: tuple[str, ...] = ("port", "label")
+
     def __init__(
         self,
         device: device.MPowerDevice,  # pylint: disable=redefined-outer-name
@@ -16,32 +20,42 @@ class MPowerEntity:
         """Initialize the entity."""
         self._device = device
         self._port = port
+        self._index = port - 1
 
         if not device.updated:
             raise MPowerAPIDataError(f"Device {device.name} must be updated first")
 
-        self._data = device.port_data[self._port - 1]
-
-        if port < 1:
-            raise ValueError(
-                f"Port number {port} for device {device.name} is too small: 1-{device.ports}"
-            )
-        if port > device.ports:
+        ports = device.ports
+        if not 1 <= port <= ports:
             raise ValueError(
-                f"Port number {port} for device {device.name} is too large: 1-{device.ports}"
+                f"Port number {port} for device {device.name} is out of range: 1-{ports}"
             )
 
+        self._data = device.port_data[self._index]
+        self._refresh()
+
     def __str__(self):
         """Represent this entity as string."""
         name = f"name={self._device.name}"
-        keys = ["port", "label"]
-        vals = ", ".join([f"{k}={getattr(self, k)}" for k in keys])
-        return f"{__class__.__name__}({name}, {vals})"
+        vals = ", ".join(f"{k}={getattr(self, k)}" for k in self._str_keys)
+        return f"{type(self).__name__}({name}, {vals})"
 
     async def update(self) -> None:
         """Update entity data from device data."""
         await self._device.update()
-        self._data = self._device.port_data[self._port - 1]
+
+    def _sync(self) -> None:
+        """Refresh cached values if the device data has been replaced."""
+        data = self._device.port_data[self._index]
+        if data is not self._data:
+            self._data = data
+            self._refresh()
+
+    def _refresh(self) -> None:
+        """Refresh cached values from entity data."""
+        self._output = bool(self._data.get("output", False))
+        self._relay = bool(self._data.get("relay", False))
+        self._lock = bool(self._data.get("lock", False))
 
     @property
     def device(self) -> device.MPowerDevice:
@@ -51,12 +65,17 @@ class MPowerEntity:
     @property
     def data(self) -> dict:
         """Return all entity data."""
+        self._sync()
         return self._data
 
     @data.setter
     def data(self, data: dict) -> None:
         """Set entity data."""
-        self._data = data
+        # NOTE: Replace the device port data instead of changing it in place
+        port_data = list(self._device.port_data)
+        port_data[self._index] = data
+        self._device.data = {**self._device.data, "sensors": port_data}
+        self._sync()
 
     @property
     def unique_id(self) -> str:
@@ -71,27 +90,36 @@ class MPowerEntity:
     @property
     def label(self) -> str:
         """Return the entity label."""
+        self._sync()
         return str(self._data.get("label", ""))
 
     @property
     def output(self) -> bool:
         """Return the current output state."""
-        return bool(self._data["output"])
+        self._sync()
+        return self._output
 
     @property
     def relay(self) -> bool:
         """Return the initial output state which is applied after device boot."""
-        return bool(self._data["relay"])
+        self._sync()
+        return self._relay
 
     @property
     def lock(self) -> bool:
         """Return the output lock state which prevents switching if enabled."""
-        return bool(self._data["lock"])
+        self._sync()
+        return self._lock
 
 
 class MPowerSensor(MPowerEntity):
     """mFi mPower sensor representation."""
 
+    # NOTE: The lazily created __dict__ allows to override precision per sensor
+    __slots__ = ("_power", "_current", "_voltage", "_powerfactor", "__dict__")
+
+    _str_keys = ("port", "label", "power", "current", "voltage", "powerfactor")
+
     precision: dict[str, float | None] = {
         "power": None,
         "current": None,
@@ -99,16 +127,20 @@ class MPowerSensor(MPowerEntity):
         "powerfactor": None,
     }
 
-    def __str__(self):
-        """Represent this sensor as string."""
-        name = f"name={self._device.name}"
-        keys = ["port", "label", "power", "current", "voltage", "powerfactor"]
-        vals = ", ".join([f"{k}={getattr(self, k)}" for k in keys])
-        return f"{__class__.__name__}({name}, {vals})"
+    def _refresh(self) -> None:
+        """Refresh cached values from sensor data."""
+        super()._refresh()
+        self._power = self._value("power")
+        self._current = self._value("current")
+        self._voltage = self._value("voltage")
+        self._powerfactor = self._value("powerfactor", scale=100)
 
     def _value(self, key: str, scale: float = 1.0) -> float:
         """Process sensor value with fallback to 0."""
-        value = scale * float(self._data.get(key, 0))
+        return scale * float(self._data.get(key, 0))
+
+    def _round(self, key: str, value: float) -> float:
+        """Round sensor value to the configured precision."""
         precision = self.precision.get(key, None)
         if precision is not None:
             return round(value, precision)
@@ -117,39 +149,38 @@ class MPowerSensor(MPowerEntity):
     @property
     def power(self) -> float:
         """Return the output power [W]."""
-        return self._value("power")
+        self._sync()
+        return self._round("power", self._power)
 
     @property
     def current(self) -> float:
         """Return the output current [A]."""
-        return self._value("current")
+        self._sync()
+        return self._round("current", self._current)
 
     @property
     def voltage(self) -> float:
         """Return the output voltage [V]."""
-        return self._value("voltage")
+        self._sync()
+        return self._round("voltage", self._voltage)
 
     @property
     def powerfactor(self) -> float:
         """Return the output current factor ("real power" / "apparent power") [%]."""
-        return self._value("powerfactor", scale=100)
+        self._sync()
+        return self._round("powerfactor", self._powerfactor)
 
 
 class MPowerSwitch(MPowerEntity):
     """mFi mPower switch representation."""
 
-    def __str__(self):
-        """Represent this switch as string."""
-        name = f"name={self._device.name}"
-        keys = ["port", "label", "output", "relay", "lock"]
-        vals = ", ".join([f"{k}={getattr(self, k)}" for k in keys])
-        return f"{__class__.__name__}({name}, {vals})"
+    __slots__ = ()
+
+    _str_keys = ("port", "label", "output", "relay", "lock")
 
     async def set(self, output: bool, refresh: bool = True) -> None:
         """Set output to on/off."""
-        await self._device.request(
-            "POST", "/mfi/sensors.cgi", data={"id": self._port, "output": int(output)}
-        )
+        await self._device.set_outputs({self._port: output}, refresh=False)
         if refresh:
             await self.update()
 
@@ -164,5 +195,10 @@ class MPowerSwitch(MPowerEntity):
     async def toggle(self, refresh: bool = True) -> None:
         """Toggle output."""
         await self.update()
-        output = not bool(self._data["output"])
+        output = not self.output
         await self.set(output, refresh=refresh)
+
+    async def toggle_fresh(self, refresh: bool = True) -> None:
+        """Toggle output based on freshly fetched instead of cached data."""
+        self._device.expire()
+        await self.toggle(refresh=refresh)